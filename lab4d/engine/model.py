@@ -851,8 +851,9 @@ class dvr_model(nn.Module):
             loss_dict["reg_deform_cyc"] = aux_dict["fg"]["cyc_dist"]
             loss_dict["reg_delta_skin"] = aux_dict["fg"]["delta_skin"]
             loss_dict["reg_skin_entropy"] = aux_dict["fg"]["skin_entropy"]
-        loss_dict["reg_soft_deform"] = self.fields.soft_deform_loss()
-        loss_dict["reg_gauss_skin"] = self.fields.gauss_skin_consistency_loss()
+        reg_rand = self.fields.sample_reg_rand()
+        loss_dict["reg_soft_deform"] = self.fields.soft_deform_loss(reg_rand)
+        loss_dict["reg_gauss_skin"] = self.fields.gauss_skin_consistency_loss(reg_rand)
         loss_dict["reg_cam_prior"] = self.fields.cam_prior_loss()
         loss_dict["reg_skel_prior"] = self.fields.skel_prior_loss()
 
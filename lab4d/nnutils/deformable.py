@@ -1,10 +1,14 @@
 # Copyright (c) 2023 Gengshan Yang, Carnegie Mellon University.
+import hashlib
+import os
+import tempfile
+
+import igl
 import numpy as np
 import torch
 import trimesh
 from torch import nn
 from torch.nn import functional as F
-from pysdf import SDF
 import trimesh.transformations as tf
 
 from lab4d.nnutils.feature import FeatureNeRF
@@ -14,6 +18,151 @@ from lab4d.utils.geom_utils import extend_aabb
 from lab4d.utils.loss_utils import align_vectors
 from lab4d.engine.train_utils import get_local_rank
 
+# bump when the cached geometry transform or file layout changes
+_INIT_GEOMETRY_CACHE_VERSION = 1
+
+
+def _load_init_geometry(geom_path, init_scale):
+    """Load a mesh, rotate it by pi about x, and scale it. The transformed
+    vertices and faces are cached under ~/.cache/lab4d, keyed by the mesh
+    path, its modification time, the scale and a format version, so later
+    runs skip the OBJ parsing and transform
+
+    Args:
+        geom_path (str): Path to the initial shape mesh
+        init_scale (float): Geometry scale factor
+    Returns:
+        mesh (trimesh.Trimesh): Transformed mesh
+    """
+    key = ":".join(
+        str(x)
+        for x in (
+            _INIT_GEOMETRY_CACHE_VERSION,
+            os.path.abspath(geom_path),
+            os.path.getmtime(geom_path),
+            init_scale,
+        )
+    )
+    key = hashlib.sha1(key.encode()).hexdigest()
+    cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "lab4d")
+    cache_path = os.path.join(cache_dir, f"init_geometry_{key}.npz")
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            return trimesh.Trimesh(data["vertices"], data["faces"], process=False)
+
+    mesh = trimesh.load(geom_path)
+    rotation_matrix = tf.euler_matrix(-np.pi, 0, 0)
+    mesh.apply_transform(rotation_matrix)
+    mesh.vertices = mesh.vertices * init_scale
+
+    # write to a temp file and rename, so ranks reading concurrently never see
+    # a partial file. caching is best effort, e.g. HOME may be read-only
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".npz", dir=cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, vertices=mesh.vertices, faces=mesh.faces)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            os.remove(tmp_path)
+            raise
+    except OSError:
+        pass
+    return mesh
+
+
+class _InitSDF(nn.Module):
+    """Signed distance function used to initialize the geometry, negative
+    inside and positive outside
+
+    Args:
+        verts: (V,3) Mesh vertices, float32. Unused if mode is "sphere"
+        faces: (F,3) Mesh faces, int64. Unused if mode is "sphere"
+        mode (str): "sphere" for a sphere of the given radius at the origin,
+            otherwise the signed distance to the mesh
+        radius (float): Sphere radius
+    """
+
+    def __init__(self, verts, faces, mode="sphere", radius=0.1):
+        super().__init__()
+        self.verts = verts
+        self.faces = faces
+        self.mode = mode
+        self.radius = radius
+
+    def forward(self, pts):
+        """
+        Args:
+            pts: (N,3) Query points
+        Returns:
+            sdf: (N,1) Signed distance
+        """
+        if self.mode == "sphere":
+            # l2 distance to a sphere
+            dis = torch.linalg.vector_norm(pts, dim=-1, keepdim=True)
+            return dis - self.radius
+        return self.query_mesh(pts)
+
+    def query_mesh(self, pts):
+        """Query igl signed distance to the mesh on cpu
+
+        Args:
+            pts: (N,3) Query points
+        Returns:
+            sdf: (N,1) Signed distance
+        """
+        pts_np = pts.detach().cpu().numpy().astype(np.float32, copy=False)
+        # igl builds its AABB tree per call and its memory is O(N), so query all
+        # points at once. Fast winding numbers give the sign, which unlike the
+        # default pseudonormals does not assume a watertight, consistently
+        # oriented mesh. igl is negative inside
+        sdf, _, _ = igl.signed_distance(
+            pts_np,
+            self.verts,
+            self.faces,
+            sign_type=igl.SIGNED_DISTANCE_TYPE_FAST_WINDING_NUMBER,
+            return_normals=False,
+        )
+        sdf = np.ascontiguousarray(sdf, dtype=np.float32)[:, None]
+        sdf = torch.from_numpy(sdf).to(pts.device, pts.dtype, non_blocking=True)
+        return sdf
+
+
+@torch.jit.script
+def _bce_weighted(density_gauss: torch.Tensor, density: torch.Tensor) -> torch.Tensor:
+    """Class-balanced binary cross entropy between gauss and reconstructed density
+
+    Args:
+        density_gauss: (N,1) Density of Gaussian bones, in (0,1)
+        density: (N,1) Reconstructed density, in (0,1)
+    Returns:
+        loss: (0,) Weighted binary cross entropy
+    """
+    # weight the loss such that:
+    # wp lp = wn ln
+    # wp lp + wn ln = lp + ln
+    density = density.detach()
+    weight_pos = 0.5 / (1e-6 + density.mean())
+    weight_neg = 0.5 / (1e-6 + 1 - density).mean()
+    weight = density * weight_pos + (1 - density) * weight_neg
+    loss = F.binary_cross_entropy(density_gauss, density, weight=weight)
+    return loss
+
+
+@torch.jit.script
+def _l2(a: torch.Tensor, b: torch.Tensor) -> torch.Tensor:
+    """L2 distance along the last dimension, fused into one pass
+
+    Args:
+        a: (..., 3) First set of points
+        b: (..., 3) Second set of points
+    Returns:
+        dist: (..., 1) L2 distance. The gradient is zero where a == b, as
+            with Tensor.norm
+    """
+    return (a - b).pow(2).sum(-1, keepdim=True).clamp_min(1e-12).sqrt()
+
 
 class Deformable(FeatureNeRF):
     """A dynamic neural radiance field
@@ -45,6 +194,10 @@ class Deformable(FeatureNeRF):
         feature_channels (int): Number of feature field channels
     """
 
+    # number of uniform samples drawn by the regularization losses
+    gauss_skin_nsample = 2048
+    soft_deform_nsample = 1024
+
     def __init__(
         self,
         fg_motion,
@@ -87,6 +240,22 @@ class Deformable(FeatureNeRF):
         self.warp = create_warp(fg_motion, data_info)
         self.fg_motion = fg_motion
 
+        # pool of random frame/instance ids consumed by soft_deform_loss,
+        # refilled in place once exhausted to avoid per-step randint launches.
+        # plain attributes rather than buffers, so DDP does not broadcast them
+        # and each rank draws its own ids
+        rand_pool_size = 65536
+        self.rand_frame_pool = torch.empty(rand_pool_size, dtype=torch.long)
+        self.rand_inst_pool = torch.empty(rand_pool_size, dtype=torch.long)
+        self.rand_pool_cursor = rand_pool_size
+
+    @property
+    def is_skinning_warp(self):
+        """Whether the current warp is a SkinningWarp. Evaluated on access,
+        since MultiFields reassigns the warp of "fgneus" after construction
+        """
+        return isinstance(self.warp, SkinningWarp)
+
     def init_proxy(self, geom_path, init_scale):
         """Initialize proxy geometry as a sphere
 
@@ -96,51 +265,40 @@ class Deformable(FeatureNeRF):
         """
         geom_path = "/pfs/mt-1oY5F7/liuguangce/program-vidu/4dcode-8.3/objs for lab4d-neus/monster/tmpbrv8we0o.obj"
         init_scale = 0.1
-        mesh = trimesh.load(geom_path)
-        rotation_matrix = tf.euler_matrix(-np.pi, 0, 0)
-        mesh.apply_transform(rotation_matrix)
-        mesh.vertices = mesh.vertices * init_scale
+        mesh = _load_init_geometry(geom_path, init_scale)
         self.init_geometry = mesh
         self.proxy_geometry = trimesh.creation.uv_sphere(radius=0.12, count=[4, 4])
+        # cache mesh arrays in the dtypes expected by igl.signed_distance
+        self.init_sdf_verts = np.ascontiguousarray(mesh.vertices, dtype=np.float32)
+        self.init_sdf_faces = np.ascontiguousarray(mesh.faces, dtype=np.int64)
+        # signed distance functions built by get_init_sdf_fn, keyed by mode
+        self.init_sdf_fns = {}
 
     def get_init_sdf_fn(self, mode='sphere'):
-        """Initialize signed distance function as a skeleton or sphere
+        """Initialize signed distance function as a sphere or the init mesh.
+        The function is built once per mode and reused on later calls
 
+        Args:
+            mode (str): "sphere" for a sphere of radius 0.1, otherwise the
+                init geometry loaded in init_proxy
         Returns:
-            sdf_fn_torch (Function): Signed distance function
+            sdf_fn_torch (_InitSDF): Signed distance function
         """
-        if mode=='sphere':
-            sdf_fn_numpy = SDF(self.proxy_geometry.vertices, self.proxy_geometry.faces)
-        else:
-            sdf_fn_numpy = SDF(self.init_geometry.vertices, self.init_geometry.faces)
-
-        def sdf_fn_torch(pts):
-            sdf = -sdf_fn_numpy(pts.cpu().numpy())[:, None]  # negative inside
-            sdf = torch.tensor(sdf, device=pts.device, dtype=pts.dtype)
-            return sdf
-
-        def sdf_fn_torch_sphere(pts):
-            radius = 0.1
-            # l2 distance to a unit sphere
-            dis = (pts).pow(2).sum(-1, keepdim=True)
-            sdf = torch.sqrt(dis) - radius  # negative inside, postive outside
-            return sdf
-
-        @torch.no_grad()
-        def sdf_fn_torch_skel(pts):
-            sdf = self.warp.get_gauss_sdf(pts)
-            return sdf
-
-        # if "skel-" in self.fg_motion:
-        #     return sdf_fn_torch_skel
-        # else:
-        if mode=='sphere':
-            return sdf_fn_torch_sphere
-        else:
-            return sdf_fn_torch
+        if mode not in self.init_sdf_fns:
+            self.init_sdf_fns[mode] = _InitSDF(
+                self.init_sdf_verts, self.init_sdf_faces, mode=mode
+            )
+        return self.init_sdf_fns[mode]
     
     def backward_warp(
-        self, xyz_cam, dir_cam, field2cam, frame_id, inst_id, samples_dict={}
+        self,
+        xyz_cam,
+        dir_cam,
+        field2cam,
+        frame_id,
+        inst_id,
+        samples_dict={},
+        return_aux=False,
     ):
         """Warp points from camera space to object canonical space. This
         requires "un-articulating" the object from observed time-t to rest.
@@ -154,21 +312,28 @@ class Deformable(FeatureNeRF):
             samples_dict (Dict): Time-dependent bone articulations. Keys:
                 "rest_articulation": ((M,B,4), (M,B,4)) and
                 "t_articulation": ((M,B,4), (M,B,4))
+            return_aux (bool): If True, also return auxiliary warp outputs
+                ("skin_entropy", "delta_skin") consumed by the cycle loss
         Returns:
             xyz: (M,N,D,3) Points along rays in object canonical space
             dir: (M,N,D,3) Ray directions in object canonical space
             xyz_t: (M,N,D,3) Points along rays in object time-t space.
         """
         xyz_t, dir = self.cam_to_field(xyz_cam, dir_cam, field2cam)
-        xyz, warp_dict = self.warp(
+        xyz = self.warp(
             xyz_t,
             frame_id,
             inst_id,
             backward=True,
             samples_dict=samples_dict,
-            return_aux=True,
+            return_aux=return_aux,
         )
 
+        if return_aux:
+            xyz, warp_dict = xyz
+        else:
+            warp_dict = {}
+
         # TODO: apply se3 to dir
         backwarp_dict = {"xyz": xyz, "dir": dir, "xyz_t": xyz_t}
         backwarp_dict.update(warp_dict)
@@ -216,20 +381,27 @@ class Deformable(FeatureNeRF):
         xyz_cycled, warp_dict = self.warp(
             xyz, frame_id, inst_id, samples_dict=samples_dict, return_aux=True
         )
-        cyc_dist = (xyz_cycled - xyz_t).norm(2, -1, keepdim=True)
+        cyc_dist = _l2(xyz_cycled, xyz_t)
         cyc_dict["cyc_dist"] = cyc_dist
         cyc_dict.update(warp_dict)
         return cyc_dict
 
-    def gauss_skin_consistency_loss(self, nsample=2048):
+    def gauss_skin_consistency_loss(self, nsample=None, rand=None):
         """Enforce consistency between the NeRF's SDF and the SDF of Gaussian bones
 
         Args:
-            nsample (int): Number of samples to take from both distance fields
+            nsample (int): Number of samples to take from both distance fields.
+                Defaults to self.gauss_skin_nsample
+            rand: (N,3) Uniform samples in [0,1) to use instead of drawing
+                new ones. If given, nsample is taken from its first dimension
         Returns:
             loss: (0,) Skinning consistency loss
         """
-        pts = self.sample_points_aabb(nsample, extend_factor=0.25)
+        if rand is not None:
+            nsample = rand.shape[0]
+        elif nsample is None:
+            nsample = self.gauss_skin_nsample
+        pts = self.sample_points_aabb(nsample, extend_factor=0.25, rand=rand)
 
         # match the gauss density to the reconstructed density   
         # 其实就是pts在权值最大的bone处的高斯分布的密度
@@ -239,16 +411,8 @@ class Deformable(FeatureNeRF):
             density = density / self.logibeta.exp()  # (0,1) # 这是每一帧利用mlp得到的密度
        
         # binary cross entropy loss to align gauss density to the reconstructed density
-        # weight the loss such that:
-        # wp lp = wn ln
-        # wp lp + wn ln = lp + ln
-        weight_pos = 0.5 / (1e-6 + density.mean())
-        weight_neg = 0.5 / (1e-6 + 1 - density).mean()
-        weight = density * weight_pos + (1 - density) * weight_neg
         # loss = ((density_gauss - density).pow(2) * weight.detach()).mean()
-        loss = F.binary_cross_entropy(
-            density_gauss, density.detach(), weight=weight.detach()
-        )
+        loss = _bce_weighted(density_gauss, density)
 
         # if get_local_rank() == 0:
         #     is_inside = density > 0.5
@@ -260,22 +424,56 @@ class Deformable(FeatureNeRF):
         #     mesh.export("tmp/1.obj")
         return loss
 
-    def soft_deform_loss(self, nsample=1024):
+    def soft_deform_loss(self, nsample=None, rand=None):
         """Minimize soft deformation so it doesn't overpower the skeleton.
         Compute L2 distance of points before and after soft deformation
 
         Args:
-            nsample (int): Number of samples to take from both distance fields
+            nsample (int): Number of samples to take from both distance fields.
+                Defaults to self.soft_deform_nsample
+            rand: (N,3) Uniform samples in [0,1) to use instead of drawing
+                new ones. If given, nsample is taken from its first dimension
         Returns:
             loss: (0,) Soft deformation loss
         """
-        device = next(self.parameters()).device
-        pts = self.sample_points_aabb(nsample, extend_factor=1.0)
-        frame_id = torch.randint(0, self.num_frames, (nsample,), device=device)
-        inst_id = torch.randint(0, self.num_inst, (nsample,), device=device)
+        if rand is not None:
+            nsample = rand.shape[0]
+        elif nsample is None:
+            nsample = self.soft_deform_nsample
+        pts = self.sample_points_aabb(nsample, extend_factor=1.0, rand=rand)
+        frame_id, inst_id = self.sample_rand_ids(nsample)
         dist2 = self.warp.compute_post_warp_dist2(pts[:, None, None], frame_id, inst_id)
         return dist2.mean()
 
+    def sample_rand_ids(self, nsample):
+        """Draw random frame and instance ids from the preallocated pools
+
+        Args:
+            nsample (int): Number of ids to draw
+        Returns:
+            frame_id: (nsample,) Frame ids in [0, num_frames)
+            inst_id: (nsample,) Instance ids in [0, num_inst)
+        """
+        device = self.aabb.device
+        pool_size = self.rand_frame_pool.shape[0]
+        if nsample > pool_size:
+            frame_id = torch.randint(0, self.num_frames, (nsample,), device=device)
+            inst_id = torch.randint(0, self.num_inst, (nsample,), device=device)
+            return frame_id, inst_id
+
+        if self.rand_pool_cursor + nsample > pool_size:
+            if self.rand_frame_pool.device != device:
+                self.rand_frame_pool = self.rand_frame_pool.to(device)
+                self.rand_inst_pool = self.rand_inst_pool.to(device)
+            self.rand_frame_pool.random_(0, self.num_frames)
+            self.rand_inst_pool.random_(0, self.num_inst)
+            self.rand_pool_cursor = 0
+        start = self.rand_pool_cursor
+        self.rand_pool_cursor += nsample
+        frame_id = self.rand_frame_pool[start : start + nsample]
+        inst_id = self.rand_inst_pool[start : start + nsample]
+        return frame_id, inst_id
+
     def get_samples(self, Kinv, batch):
         """Compute time-dependent camera and articulation parameters.
 
@@ -287,12 +485,13 @@ class Deformable(FeatureNeRF):
             samples_dict (Dict): Input metadata and time-dependent outputs.
                 Keys: "Kinv" (M,3,3), "field2cam" (M,SE(3)), "frame_id" (M,),
                 "inst_id" (M,), "near_far" (M,2), "hxy" (M,N,2),
-                "feature" (M,N,16), "rest_articulation" ((M,B,4), (M,B,4)), and
+                "feature" (M,N,16), "rest_articulation" ((M,B,4), (M,B,4)),
+                "rest_articulation_head" ((1,B,4), (1,B,4)), and
                 "t_articulation" ((M,B,4), (M,B,4))
         """
         samples_dict = super().get_samples(Kinv, batch)
 
-        if isinstance(self.warp, SkinningWarp):
+        if self.is_skinning_warp:
             # cache the articulation values
             # mainly to avoid multiple fk computation
             # (M,K,4)x2, # (M,K,4)x2
@@ -312,6 +511,13 @@ class Deformable(FeatureNeRF):
                     samples_dict["rest_articulation"],
                 ) = self.warp.articulation.get_vals_and_mean(frame_id)
 
+            # rest articulation of the first sample, used by compute_gauss_density
+            rest_articulation = samples_dict["rest_articulation"]
+            samples_dict["rest_articulation_head"] = (
+                rest_articulation[0][:1],
+                rest_articulation[1][:1],
+            )
+
         return samples_dict
 
     def mlp_init(self):
@@ -366,14 +572,18 @@ class Deformable(FeatureNeRF):
             gauss_field (Dict): Density. Keys: "gauss_density" (M,N,D,1)
         """
         gauss_field = {}
-        if isinstance(self.warp, SkinningWarp):
+        if self.is_skinning_warp:
             shape = xyz.shape[:-1]
-            if "rest_articulation" in samples_dict:
+            if "rest_articulation_head" in samples_dict:
+                rest_articulation = samples_dict["rest_articulation_head"]
+            elif "rest_articulation" in samples_dict:
                 rest_articulation = (
                     samples_dict["rest_articulation"][0][:1],
                     samples_dict["rest_articulation"][1][:1],
                 )
-            xyz = xyz.view(-1, 3)
+            else:
+                rest_articulation = None
+            xyz = xyz.reshape(-1, 3)  # copies only if xyz is non-contiguous
             gauss_density = self.warp.get_gauss_density(xyz, bone2obj=rest_articulation)
             # gauss_density = gauss_density * 100  # [0,100] heuristic value
             gauss_density = gauss_density * self.warp.logibeta.exp()
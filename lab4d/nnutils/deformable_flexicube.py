@@ -424,8 +424,8 @@ class DeformableFlexicube(Deformable):
         def sdf_fn_torch_sphere(pts):
             radius = 0.1
             # l2 distance to a unit sphere
-            dis = (pts).pow(2).sum(-1, keepdim=True)
-            sdf = torch.sqrt(dis) - radius  # negative inside, postive outside
+            dis = torch.linalg.vector_norm(pts, dim=-1, keepdim=True)
+            sdf = dis - radius  # negative inside, postive outside
             return sdf
 
         @torch.no_grad()
@@ -439,7 +439,14 @@ class DeformableFlexicube(Deformable):
             return sdf_fn_torch_sphere
 
     def backward_warp(
-        self, xyz_cam, dir_cam, field2cam, frame_id, inst_id, samples_dict={}
+        self,
+        xyz_cam,
+        dir_cam,
+        field2cam,
+        frame_id,
+        inst_id,
+        samples_dict={},
+        return_aux=False,
     ):
         """Warp points from camera space to object canonical space. This
         requires "un-articulating" the object from observed time-t to rest.
@@ -453,21 +460,28 @@ class DeformableFlexicube(Deformable):
             samples_dict (Dict): Time-dependent bone articulations. Keys:
                 "rest_articulation": ((M,B,4), (M,B,4)) and
                 "t_articulation": ((M,B,4), (M,B,4))
+            return_aux (bool): If True, also return auxiliary warp outputs
+                ("skin_entropy", "delta_skin") consumed by the cycle loss
         Returns:
             xyz: (M,N,D,3) Points along rays in object canonical space
             dir: (M,N,D,3) Ray directions in object canonical space
             xyz_t: (M,N,D,3) Points along rays in object time-t space.
         """
         xyz_t, dir = self.cam_to_field(xyz_cam, dir_cam, field2cam)
-        xyz, warp_dict = self.warp(
+        xyz = self.warp(
             xyz_t,
             frame_id,
             inst_id,
             backward=True,
             samples_dict=samples_dict,
-            return_aux=True,
+            return_aux=return_aux,
         )
 
+        if return_aux:
+            xyz, warp_dict = xyz
+        else:
+            warp_dict = {}
+
         # TODO: apply se3 to dir
         backwarp_dict = {"xyz": xyz, "dir": dir, "xyz_t": xyz_t}
         backwarp_dict.update(warp_dict)
@@ -519,15 +533,22 @@ class DeformableFlexicube(Deformable):
         cyc_dict.update(warp_dict)
         return cyc_dict
 
-    def gauss_skin_consistency_loss(self, nsample=2048):
+    def gauss_skin_consistency_loss(self, nsample=None, rand=None):
         """Enforce consistency between the NeRF's SDF and the SDF of Gaussian bones
 
         Args:
-            nsample (int): Number of samples to take from both distance fields
+            nsample (int): Number of samples to take from both distance fields.
+                Defaults to self.gauss_skin_nsample
+            rand: (N,3) Uniform samples in [0,1) to use instead of drawing
+                new ones. If given, nsample is taken from its first dimension
         Returns:
             loss: (0,) Skinning consistency loss
         """
-        pts = self.sample_points_aabb(nsample, extend_factor=0.25)
+        if rand is not None:
+            nsample = rand.shape[0]
+        elif nsample is None:
+            nsample = self.gauss_skin_nsample
+        pts = self.sample_points_aabb(nsample, extend_factor=0.25, rand=rand)
 
         # match the gauss density to the reconstructed density
         density_gauss = self.warp.get_gauss_density(pts)  # (N,1)
@@ -557,17 +578,24 @@ class DeformableFlexicube(Deformable):
         #     mesh.export("tmp/1.obj")
         return loss
 
-    def soft_deform_loss(self, nsample=1024):
+    def soft_deform_loss(self, nsample=None, rand=None):
         """Minimize soft deformation so it doesn't overpower the skeleton.
         Compute L2 distance of points before and after soft deformation
 
         Args:
-            nsample (int): Number of samples to take from both distance fields
+            nsample (int): Number of samples to take from both distance fields.
+                Defaults to self.soft_deform_nsample
+            rand: (N,3) Uniform samples in [0,1) to use instead of drawing
+                new ones. If given, nsample is taken from its first dimension
         Returns:
             loss: (0,) Soft deformation loss
         """
+        if rand is not None:
+            nsample = rand.shape[0]
+        elif nsample is None:
+            nsample = self.soft_deform_nsample
         device = next(self.parameters()).device
-        pts = self.sample_points_aabb(nsample, extend_factor=1.0)
+        pts = self.sample_points_aabb(nsample, extend_factor=1.0, rand=rand)
         frame_id = torch.randint(0, self.num_frames, (nsample,), device=device)
         inst_id = torch.randint(0, self.num_inst, (nsample,), device=device)
         dist2 = self.warp.compute_post_warp_dist2(pts[:, None, None], frame_id, inst_id)
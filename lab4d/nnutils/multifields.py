@@ -316,35 +316,72 @@ class MultiFields(nn.Module):
         loss = torch.stack(loss, 0).sum(0).mean()
         return loss
 
-    def gauss_skin_consistency_loss(self):
+    def sample_reg_rand(self):
+        """Draw the uniform samples of gauss_skin_consistency_loss and
+        soft_deform_loss with a single call per deformable child field. Only
+        the splits consumed by a field's losses are drawn
+
+        Returns:
+            reg_rand (Dict): Maps category to a dict of uniform samples in
+                [0,1): "gauss_skin" (field.gauss_skin_nsample,3) for skinning
+                warps and "soft_deform" (field.soft_deform_nsample,3) for
+                composed warps
+        """
+        reg_rand = {}
+        for category, field in self.field_params.items():
+            if not isinstance(field, Deformable):
+                continue
+            sizes = {}
+            if isinstance(field.warp, SkinningWarp):
+                sizes["gauss_skin"] = field.gauss_skin_nsample
+            if isinstance(field.warp, ComposedWarp):
+                sizes["soft_deform"] = field.soft_deform_nsample
+            if len(sizes) == 0:
+                continue
+            device = field.aabb.device
+            rand = torch.rand(
+                sum(sizes.values()), 3, dtype=torch.float32, device=device
+            )
+            reg_rand[category] = dict(zip(sizes, rand.split(list(sizes.values()))))
+        return reg_rand
+
+    def gauss_skin_consistency_loss(self, reg_rand={}):
         """Compute mean Gauss skin consistency loss over all child fields.
         Enforce consistency between the NeRF's SDF and the SDF of Gaussian bones
 
+        Args:
+            reg_rand (Dict): Uniform samples from sample_reg_rand(). Fields
+                without an entry draw their own
         Returns:
             loss: (0,) Mean Gauss skin consistency loss
         """
         loss = []
-        for field in self.field_params.values():
+        for category, field in self.field_params.items():
             if isinstance(field, Deformable) and isinstance(field.warp, SkinningWarp):
-                loss.append(field.gauss_skin_consistency_loss())
+                rand = reg_rand.get(category, {}).get("gauss_skin")
+                loss.append(field.gauss_skin_consistency_loss(rand=rand))
         if len(loss) > 0:
             loss = torch.stack(loss, 0).mean()
         else:
             loss = torch.tensor(0.0, device=self.parameters().__next__().device)
         return loss
 
-    def soft_deform_loss(self):
+    def soft_deform_loss(self, reg_rand={}):
         """Compute average soft deformation loss over all child fields.
         Minimize soft deformation so it doesn't overpower the skeleton.
         Compute L2 distance of points before and after soft deformation
 
+        Args:
+            reg_rand (Dict): Uniform samples from sample_reg_rand(). Fields
+                without an entry draw their own
         Returns:
             loss: (0,) Soft deformation loss
         """
         loss = []
-        for field in self.field_params.values():
+        for category, field in self.field_params.items():
             if isinstance(field, Deformable) and isinstance(field.warp, ComposedWarp):
-                loss.append(field.soft_deform_loss())
+                rand = reg_rand.get(category, {}).get("soft_deform")
+                loss.append(field.soft_deform_loss(rand=rand))
         if len(loss) > 0:
             loss = torch.stack(loss, 0).mean()
         else:
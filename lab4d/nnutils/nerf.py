@@ -439,23 +439,23 @@ class NeRF(nn.Module):
                 frame_mapping
             ] * beta + near_far * (1 - beta)
 
-    def sample_points_aabb(self, nsample, extend_factor=1.0):
+    def sample_points_aabb(self, nsample, extend_factor=1.0, rand=None):
         """Sample points within axis-aligned bounding box
 
         Args:
             nsample (int): Number of samples
             extend_factor (float): Extend aabb along each side by factor of
                 the previous size
+            rand: (nsample, 3) Uniform samples in [0,1) to map into the aabb.
+                If None, draw new ones
         Returns:
             pts: (nsample, 3) Sampled points
         """
-        device = next(self.parameters()).device
+        if rand is None:
+            device = next(self.parameters()).device
+            rand = torch.rand(nsample, 3, dtype=torch.float32, device=device)
         aabb = extend_aabb(self.aabb, factor=extend_factor)
-        pts = (
-            torch.rand(nsample, 3, dtype=torch.float32, device=device)
-            * (aabb[1:] - aabb[:1])
-            + aabb[:1]
-        )
+        pts = rand * (aabb[1:] - aabb[:1]) + aabb[:1]
         return pts
 
     def visibility_decay_loss(self, nsample=512):
@@ -710,13 +710,25 @@ class NeRF(nn.Module):
         # FoVy = 2 * torch.arctan(Kmat[1, 2] / Kmat[1, 1])
         # print("FoVx, FoVy", FoVx * 180 / np.pi, FoVy * 180 / np.pi)
 
+        # auxiliary warp outputs are only consumed together with the cycle loss,
+        # which is train-only
+        compute_cycle = (
+            not "is_gen3d" in samples_dict.keys() and not self.opts["two_branch"]
+        )
+
         if "no_warp" in samples_dict.keys():
             xyz, dir = self.cam_to_field(xyz_cam, dir_cam, field2cam)
             xyz_t = xyz
         else:
             # backward warping
             backwarp_dict = self.backward_warp(
-                xyz_cam, dir_cam, field2cam, frame_id, inst_id, samples_dict=samples_dict
+                xyz_cam,
+                dir_cam,
+                field2cam,
+                frame_id,
+                inst_id,
+                samples_dict=samples_dict,
+                return_aux=compute_cycle and self.training,
             )
             xyz = backwarp_dict["xyz"]
             dir = backwarp_dict["dir"]
@@ -960,7 +972,14 @@ class NeRF(nn.Module):
         return xyz_cam_next
 
     def backward_warp(
-        self, xyz_cam, dir_cam, field2cam, frame_id, inst_id, samples_dict={}
+        self,
+        xyz_cam,
+        dir_cam,
+        field2cam,
+        frame_id,
+        inst_id,
+        samples_dict={},
+        return_aux=False,
     ):
         """Warp points from camera space to object canonical space
 
@@ -971,6 +990,7 @@ class NeRF(nn.Module):
             frame_id: (M,) Frame id. If None, warp for all frames
             inst_id: (M,) Instance id. If None, warp for the average instance
             samples_dict (Dict): Only used in Deformable
+            return_aux (bool): Only used in Deformable
 
         Returns:
             xyz: (M,N,D,3) Points along rays in object canonical space
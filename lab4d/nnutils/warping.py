@@ -433,12 +433,12 @@ class SkinningWarp(IdentityWarp):
         #     out = dual_quaternion_skinning(se3, xyz, skin_prob)
 
 
-        warp_dict = {}
-        warp_dict["skin_entropy"] = cross_entropy_skin_loss(skin)[..., None]
-        if delta_skin is not None:
-            # (M, N, D, 1)
-            warp_dict["delta_skin"] = delta_skin.pow(2).mean(-1, keepdims=True)
         if return_aux:
+            warp_dict = {}
+            warp_dict["skin_entropy"] = cross_entropy_skin_loss(skin)[..., None]
+            if delta_skin is not None:
+                # (M, N, D, 1)
+                warp_dict["delta_skin"] = delta_skin.pow(2).mean(-1, keepdims=True)
             return out, warp_dict
         else:
             return out
@@ -572,14 +572,16 @@ class ComposedWarp(SkinningWarp):
                 xyz, frame_id, inst_id, backward=False, samples_dict=samples_dict
             )
 
-        out, warp_dict = super().forward(
+        out = super().forward(
             xyz,
             frame_id,
             inst_id,
             backward=backward,
             samples_dict=samples_dict,
-            return_aux=True,
+            return_aux=return_aux,
         )
+        if return_aux:
+            out, warp_dict = out
 
         if backward and frame_id is not None:
             out = self.post_warp.forward(
@@ -5,11 +5,13 @@ import sys
 import cv2
 import numpy as np
 import torch
+import torch.nn.functional as F
 
 sys.path.insert(0, os.getcwd())
 
 from lab4d.tests.utils import check_func
 from lab4d.utils.geom_utils import so3_to_exp_map
+from lab4d.utils.loss_utils import cross_entropy_skin_loss
 from lab4d.utils.quat_transform import (
     axis_angle_to_quaternion,
     quaternion_translation_mul,
@@ -153,6 +155,24 @@ def test_construct_eval_batch_hxy(eval_size, len_fid, device):
     check_func(impl1, impl2, (eval_size, len_fid, device), name="construct_eval_batch")
 
 
+def test_cross_entropy_skin_loss(skin):
+    """Test efficient implementation of utils/loss_utils.py::cross_entropy_skin_loss"""
+
+    def impl1(skin):
+        shape = skin.shape
+        nbones = shape[-1]
+        full_skin = skin.clone()
+        score, indices = skin.max(-1, keepdim=True)
+        skin = torch.zeros_like(skin).fill_(0)
+        skin = skin.scatter(-1, indices, torch.ones_like(score))
+        cross_entropy = F.cross_entropy(
+            full_skin.view(-1, nbones), skin.view(-1, nbones), reduction="none"
+        )
+        return cross_entropy.view(shape[:-1])
+
+    check_func(impl1, cross_entropy_skin_loss, (skin,), name="cross_entropy_skin_loss")
+
+
 def test_matmul(V):
     """Test efficient implementation of matmul in utils/quat_transform.py"""
 
@@ -276,6 +296,10 @@ if __name__ == "__main__":
 
     # test_matmul(torch.randn(1, 1, 1, dtype=torch.float32, device="cuda"))
 
+    # test_cross_entropy_skin_loss(
+    #     torch.randn(8, 64, 64, 25, dtype=torch.float32, device="cuda")
+    # )
+
     test_quat_to_matrix(torch.randn(4096, 4, dtype=torch.float32, device="cuda"))
 
     # local_rest_joints = torch.randn(256, 23, 3, dtype=torch.float32, device="cuda")
@@ -14,7 +14,8 @@ def entropy_loss(prob, dim=-1):
     Returns:
         entropy (...,) Entropy of each distribution
     """
-    entropy = -(prob * (prob + 1e-9).log()).sum(dim)
+    # keep the epsilon so the gradient stays finite at prob = 0
+    entropy = -torch.special.xlogy(prob, prob + 1e-9).sum(dim)
     return entropy
 
 
@@ -28,15 +29,12 @@ def cross_entropy_skin_loss(skin):
     """
     shape = skin.shape
     nbones = shape[-1]
-    full_skin = skin.clone()
     # print("weight min max mean:", skin.min(), skin.max(), skin.mean())
     # find the most likely bone assignment
-    score, indices = skin.max(-1, keepdim=True)
-    skin = torch.zeros_like(skin).fill_(0)
-    skin = skin.scatter(-1, indices, torch.ones_like(score))
+    indices = skin.argmax(-1)
 
     cross_entropy = F.cross_entropy(
-        full_skin.view(-1, nbones), skin.view(-1, nbones), reduction="none"
+        skin.reshape(-1, nbones), indices.view(-1), reduction="none"
     )
     cross_entropy = cross_entropy.view(shape[:-1])
     return cross_entropy
@@ -52,7 +50,9 @@ def align_vectors(v1, v2):
     Returns:
         scale_fac (1,): Scale factor
     """
-    scale_fac = (v1 * v2).sum() / (v1 * v1).sum()
-    if scale_fac < 0:
-        scale_fac = torch.tensor([1.0], device=scale_fac.device)
+    num = (v1 * v2).sum()
+    den = (v1 * v1).sum().clamp_min(1e-12)
+    scale_fac = (num / den).view(1)
+    # fall back to 1 for negative scales without syncing on a python branch
+    scale_fac = torch.where(scale_fac < 0, torch.ones_like(scale_fac), scale_fac)
     return scale_fac